@@ -37,7 +37,7 @@ def batch_iterable(iterable, n=1):
 def scores_to_tokens(scores):
     '''expect `$logits` to be a single column of logits '''
     assert len(scores[0]) == tokenizer.vocab_size
-    top_score, top_idx = torch.topk(scores, k=1, dim=1)
+    top_score, top_idx = torch.max(scores, dim=1, keepdim=True)
     # print(torch.topk(logits, k=20, dim=1))
     text = tokenizer.batch_decode(top_idx.tolist())
     print((top_score, top_idx, text))
@@ -2,7 +2,7 @@ from transformers import GPT2Tokenizer, GPT2LMHeadModel
 import torch
 import wandb
 import math
-from utils import one_hot, decode_with_embedding, get_text_from_logits, decode_with_one_hot
+from utils import decode_with_embedding, get_text_from_logits, decode_with_one_hot
 from os import listdir
 
 wandb.init(project='discrete prompt from continuous')
@@ -117,9 +117,7 @@ def experiment1():
     input_ids = tokenizer.encode(
         "While the best food in Seattle is kebab, there are other form of garbage sentences that one can extract in order to",
         return_tensors="pt").to(device)
-    input_one_hot = one_hot(input_ids, dimension=tokenizer.vocab_size)
-    prompt_embedding = torch.matmul(input_one_hot.type(torch.FloatTensor).to(device),
-                                    model.get_input_embeddings().weight)
+    prompt_embedding = model.get_input_embeddings()(input_ids)
     discrete_prompt_from_continuous(prompt_embedding)
 
 
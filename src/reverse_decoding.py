@@ -53,14 +53,14 @@ for iter in range(1000):
     for i in range(phrase_length):
         if past is None:
             # the embeddings extracted from the optimized parameters
-            inputs_embeds = embed_inputs(model.get_input_embeddings(), optimized_logits / temperature, device='cuda')
+            inputs_embeds = embed_inputs(model.get_input_embeddings(), optimized_logits / temperature)
         model_outputs = model(past_key_values=past, inputs_embeds=inputs_embeds)
         logits = model_outputs.logits
         past = model_outputs.past_key_values
         logits = logits[:, -1, :] / temperature
         logits = logits.unsqueeze(1)
         logits_so_far = logits if logits_so_far is None else torch.cat((logits_so_far, logits), dim=1)
-        inputs_embeds = embed_inputs(model.get_input_embeddings(), logits, device='cuda')
+        inputs_embeds = embed_inputs(model.get_input_embeddings(), logits)
 
     # convert logits to probabilities
     probs_so_far = F.softmax(logits_so_far, dim=2)
@@ -10,21 +10,14 @@ tokenizer = None
 device = 'cuda'
 
 
-def _greedy(logits):
-    _, last = torch.topk(logits, k=1, dim=-1)
-    return last
-
-
 def get_text_from_logits(logits, tokenizer):
-    output_so_far = None
-    last = None
-    logp = 0
-    for i in range(logits.shape[0]):
-        last = _greedy(logits[i, :])
-        output_so_far = last if output_so_far is None else torch.cat((output_so_far, last), dim=0)
-        logp += logits[i, :].log_softmax(-1)[last.item()].item()
-    nll = -logp
-    text = tokenizer.decode_with_one_hot(output_so_far.tolist())
+    logits = logits.detach().float()
+    # the log-probability of the arg-max token is its logit minus the log-partition, which avoids
+    # materializing the whole log_softmax over the vocabulary
+    top_logits, output_so_far = logits.max(dim=-1)
+    logp = (top_logits - torch.logsumexp(logits, dim=-1)).sum()
+    nll = -logp.item()
+    text = tokenizer.decode(output_so_far.cpu().tolist())
     text = text.replace('\n', ' ')
     return text, nll, output_so_far
 
@@ -21,7 +21,6 @@ model2.to(device)
 model2.eval()
 
 input_ids = tokenizer.encode("To travel to Canada", return_tensors="pt").to(device)
-input_one_hot = utils.one_hot(input_ids, dimension=tokenizer.vocab_size)
 context_length = input_ids.size()[1]
 
 # prepare the transformation matrices
@@ -33,10 +32,8 @@ def experiment1():
     '''
     In this experiment, we use the embedding matrices of the language models to convert encoded inputs of LM1 to encoded input of LM2
     '''
-    prompt_embedding1 = torch.matmul(input_one_hot.type(torch.FloatTensor).to(device),
-                                     model1.get_input_embeddings().weight)
-    prompt_embedding2 = torch.matmul(input_one_hot.type(torch.FloatTensor).to(device),
-                                     model2.get_input_embeddings().weight)
+    prompt_embedding1 = model1.get_input_embeddings()(input_ids)
+    prompt_embedding2 = model2.get_input_embeddings()(input_ids)
 
     print(" . . . ")
     transformed_prompt_embedding2 = torch.matmul(prompt_embedding1, transformation_1_to_2_matrix)
@@ -170,10 +167,8 @@ def experiment4():
         w.zero_grad()
     w.save('linear_transfer_v1.model')
 
-    prompt_embedding1 = torch.matmul(input_one_hot.type(torch.FloatTensor).to(device),
-                                     model1.get_input_embeddings().weight)
-    prompt_embedding2 = torch.matmul(input_one_hot.type(torch.FloatTensor).to(device),
-                                     model2.get_input_embeddings().weight)
+    prompt_embedding1 = model1.get_input_embeddings()(input_ids)
+    prompt_embedding2 = model2.get_input_embeddings()(input_ids)
 
     # embeddings1 = model1.get_input_embeddings().weight
     # embeddings2 = model2.get_input_embeddings().weight
@@ -197,10 +192,8 @@ def experiment5():
     '''
     Here we load the transformation of experiment 4 and apply it on a prompt
     '''
-    prompt_embedding1 = torch.matmul(input_one_hot.type(torch.FloatTensor).to(device),
-                                     model1.get_input_embeddings().weight)
-    # prompt_embedding2 = torch.matmul(input_one_hot.type(torch.FloatTensor).to(device),
-    #                                  model2.get_input_embeddings().weight)
+    prompt_embedding1 = model1.get_input_embeddings()(input_ids)
+    # prompt_embedding2 = model2.get_input_embeddings()(input_ids)
 
     # embeddings1 = model1.get_input_embeddings().weight
     # embeddings2 = model2.get_input_embeddings().weight
@@ -265,10 +258,8 @@ def experiment6():
     Formally, joint optimization: \min_{e2, L} = norm(e1 - L x E1) + norm(e2 - L x E2)
     Optionally, we can also add entropy(L) to the loss
     '''
-    prompt_embedding1 = torch.matmul(input_one_hot.type(torch.FloatTensor).to(device),
-                                     model1.get_input_embeddings().weight)
-    prompt_embedding2 = torch.matmul(input_one_hot.type(torch.FloatTensor).to(device),
-                                     model2.get_input_embeddings().weight)
+    prompt_embedding1 = model1.get_input_embeddings()(input_ids)
+    prompt_embedding2 = model2.get_input_embeddings()(input_ids)
 
     embeddings1 = model1.get_input_embeddings().weight
     embeddings2 = model2.get_input_embeddings().weight
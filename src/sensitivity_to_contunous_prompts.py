@@ -2,7 +2,7 @@ from transformers import GPT2Tokenizer, GPT2LMHeadModel
 import torch
 import wandb
 import math
-from utils import one_hot, decode_with_embedding, get_text_from_logits
+from utils import decode_with_embedding, get_text_from_logits
 
 wandb.init(project='embedding projection')
 
@@ -15,11 +15,9 @@ model1.to(device)
 model1.eval()
 
 input_ids = tokenizer.encode("To travel to Canada", return_tensors="pt").to(device)
-input_one_hot = one_hot(input_ids, dimension=tokenizer.vocab_size)
 # context_length = input_ids.size()[1]
 
-prompt_embedding1 = torch.matmul(input_one_hot.type(torch.FloatTensor).to(device),
-                                 model1.get_input_embeddings().weight)
+prompt_embedding1 = model1.get_input_embeddings()(input_ids)
 
 l1 = torch.norm(prompt_embedding1, p=1)
 l2 = torch.norm(prompt_embedding1, p=2)
@@ -1,7 +1,18 @@
+import math
+
 import torch
 import torch.nn.functional as F
 
 
+def _next_token_logits(model, past, **inputs):
+    '''
+    runs one step of GPT2 and projects only the hidden state of the last position onto the vocabulary
+    '''
+    transformer_outputs = model.transformer(past_key_values=past, use_cache=True, output_hidden_states=False, **inputs)
+    hidden_states = transformer_outputs.last_hidden_state[:, -1, :]
+    return model.lm_head(hidden_states), transformer_outputs.past_key_values
+
+
 def decode_with_embedding(model, length, temperature, device, prompt_embedding):
     '''
     GPT2 decoding via dense representations (no arg-max)
@@ -12,101 +23,115 @@ def decode_with_embedding(model, length, temperature, device, prompt_embedding):
     for i in range(length):
         if past is None:
             inputs_embeds = prompt_embedding
-        model_outputs = model(past_key_values=past, inputs_embeds=inputs_embeds)
-        logits = model_outputs.logits
-        past = model_outputs.past_key_values
-        logits = logits[:, -1, :] / temperature
-        logits = logits.unsqueeze(1)
-        logits_so_far = logits if logits_so_far is None else torch.cat((logits_so_far, logits), dim=1)
-        inputs_embeds = embed_inputs(model.get_input_embeddings(), logits, device=device)
+        logits, past = _next_token_logits(model, past, inputs_embeds=inputs_embeds)
+        logits = logits / temperature
+        if logits_so_far is None:
+            logits_so_far = logits.new_empty((logits.shape[0], length, logits.shape[-1]))
+        logits_so_far[:, i, :] = logits
+        inputs_embeds = embed_inputs(model.get_input_embeddings(), logits.unsqueeze(1))
     return logits_so_far
 
 
-def decode_with_one_hot(model, length, input_one_hot1, temperature, device):
+def decode_with_one_hot(model, length, input_one_hot1, temperature, device, return_entropy=False):
     '''
     GPT2 decoding via dense representations (no arg-max)
+    with `return_entropy`, also returns the entropy of the (softened) prompt for each row of the batch
     '''
     past = None
     inputs_embeds1 = None
     logits_so_far = None
+    prompt_entropy = None
+    prompt_temperature = temperature
+    if torch.is_tensor(temperature):
+        # one temperature per row of the batch; the prompt is [batch, T, vocab], each step is [batch, vocab]
+        temperature = temperature.view(-1, 1)
+        prompt_temperature = temperature.unsqueeze(-1)
     for i in range(length):
         if past is None:
             # inputs_embeds = model.transformer.wte(input_ids)
-            inputs_embeds1 = embed_inputs(model.get_input_embeddings(),
-                                          input_one_hot1.type(torch.FloatTensor) / temperature, device='cuda',
-                                          print_entropy=True)
-        model_outputs = model(past_key_values=past, inputs_embeds=inputs_embeds1)
-        logits = model_outputs.logits
-        past = model_outputs.past_key_values
-        logits = logits[:, -1, :] / temperature
-        logits = logits.unsqueeze(1)
-        logits_so_far = logits if logits_so_far is None else torch.cat((logits_so_far, logits), dim=1)
-        inputs_embeds1 = embed_inputs(model.get_input_embeddings(), logits, device=device)
+            # divided in fp32 so that the exact temperatures are used, then cast to the model's dtype
+            prompt_logits = input_one_hot1.to(device=device, dtype=torch.float32) / prompt_temperature
+            if return_entropy:
+                prompt_entropy = _entropy(F.softmax(prompt_logits, dim=-1))
+            inputs_embeds1 = embed_inputs(model.get_input_embeddings(), prompt_logits.to(model.dtype))
+        logits, past = _next_token_logits(model, past, inputs_embeds=inputs_embeds1)
+        logits = (logits.float() / temperature).to(logits.dtype)
+        if logits_so_far is None:
+            logits_so_far = logits.new_empty((logits.shape[0], length, logits.shape[-1]))
+        logits_so_far[:, i, :] = logits
+        inputs_embeds1 = embed_inputs(model.get_input_embeddings(), logits.unsqueeze(1))
+    if return_entropy:
+        return logits_so_far, prompt_entropy
     return logits_so_far
 
 def decode_with_argmax(model, length, input_ids1, device):
     '''
-    GPT2 decoding via dense representations (no arg-max)
+    GPT2 greedy decoding (arg-max at each step), reusing the cached keys/values of the previous steps
     '''
     past = None
     logits_so_far = None
+    # the prompt followed by the generated tokens, written in place as they are selected
+    prompt_length = input_ids1.shape[1]
+    ids = input_ids1.new_empty((input_ids1.shape[0], prompt_length + length))
+    ids[:, :prompt_length] = input_ids1
+    input_ids1 = ids[:, :prompt_length]
     for i in range(length):
-        # if past is None:
-        # inputs_embeds = model.transformer.wte(input_ids1)
-        # inputs_embeds = embed_inputs(model.get_input_embeddings(), input_one_hot.type(torch.FloatTensor)/ temperature, device='cuda', print_entropy=True)
-        model_outputs = model(input_ids=input_ids1)
-        # else:
-        #     model_outputs = model(past_key_values=past, input_ids=input_ids1)
-        logits = model_outputs.logits
-        # past = model_outputs.past_key_values
-        logits = logits[:, -1, :]
-        logits = logits.unsqueeze(1)
-        logits_so_far = logits if logits_so_far is None else torch.cat((logits_so_far, logits), dim=1)
-        # inputs_embeds = embed_inputs(model.get_input_embeddings(), logits, device=device)
-        next_token = torch.argmax(logits)
-        input_ids1 = torch.cat([input_ids1, next_token.unsqueeze(0).unsqueeze(0)], 1)
+        # the first step consumes the whole prompt; afterwards only the newly selected token is fed to the model
+        logits, past = _next_token_logits(model, past, input_ids=input_ids1)
+        if logits_so_far is None:
+            logits_so_far = logits.new_empty((logits.shape[0], length, logits.shape[-1]))
+        logits_so_far[:, i, :] = logits
+        ids[:, prompt_length + i] = logits.argmax(dim=-1)
+        input_ids1 = ids[:, prompt_length + i:prompt_length + i + 1]
     return logits_so_far
 
 
-def embed_inputs(embedding, logits, device, print_entropy=False):
+def _entropy(probs):
+    # one value per row of the batch; xlogy is 0 where probs underflow to 0, instead of 0 * log(0) = nan
+    return torch.sum(- torch.special.xlogy(probs, probs), dim=(1, 2))
+
+
+def _soft_embed(logits, weight):
+    return torch.matmul(F.softmax(logits, dim=-1), weight)
+
+
+def embed_inputs(embedding, logits):
     '''
     embeds inputs in a dense representation, before passing them to the model
     '''
     # typically we embed a one-hot vector. But here since we work we work with dense representations,
     # we have softmax here to make sure that all the values of the input logits sum to one (similar to a 1-hot vector).
-    probs = F.softmax(logits, dim=-1)
-    # probs = logits
-    if print_entropy:
-        _entropy = - probs * torch.log(probs)
-        _entropy = torch.sum(_entropy)
-        print(_entropy)
-
-    probs = probs.to(device)
-    return torch.matmul(probs, embedding.weight)
-
-
-def _greedy(logits):
-    _, last = torch.topk(logits, k=1, dim=-1)
-    return last
+    assert logits.device == embedding.weight.device, \
+        f"the inputs ({logits.device}) and the embeddings ({embedding.weight.device}) must be on the same device"
+    needs_grad = torch.is_grad_enabled() and (logits.requires_grad or embedding.weight.requires_grad)
+    if needs_grad:
+        # the prompt-optimization scripts backpropagate through this path
+        return _soft_embed(logits, embedding.weight)
+    # when the distribution is (numerically) one-hot, i.e. the arg-max carries more than 0.999 of the mass,
+    # the weighted sum of the embedding rows is just the embedding of the arg-max token, a much cheaper lookup.
+    # the test is done in fp32 on max-shifted logits: in bf16 (or on large fp32 logits at low temperature)
+    # logsumexp(x) - max(x) cancels to 0 even for clearly spread distributions.
+    # note: deciding the branch costs one host sync per call
+    top_logits, top_ids = logits.max(dim=-1)
+    shifted_logits = logits.float() - top_logits.float().unsqueeze(-1)
+    if (torch.logsumexp(shifted_logits, dim=-1) < -math.log(0.999)).all():
+        return F.embedding(top_ids, embedding.weight)
+    return _soft_embed(logits, embedding.weight)
 
 
 def get_text_from_logits(logits, tokenizer):
-    output_so_far = None
-    last = None
-    logp = 0
-    for i in range(logits.shape[0]):
-        last = _greedy(logits[i, :])
-        output_so_far = last if output_so_far is None else torch.cat((output_so_far, last), dim=0)
-        logp += logits[i, :].log_softmax(-1)[last.item()].item()
-    nll = -logp
-    text = tokenizer.decode(output_so_far.tolist())
+    logits = logits.detach().float()
+    # the log-probability of the arg-max token is its logit minus the log-partition, which avoids
+    # materializing the whole log_softmax over the vocabulary
+    top_logits, output_so_far = logits.max(dim=-1)
+    logp = (top_logits - torch.logsumexp(logits, dim=-1)).sum()
+    nll = -logp.item()
+    text = tokenizer.decode(output_so_far.cpu().tolist())
     text = text.replace('\n', ' ')
     return text, nll, output_so_far
 
 
 def one_hot(tensor, dimension):
-    while len(tensor.shape) < 2:
-        tensor = tensor.unsqueeze(0)
-    onehot = torch.LongTensor(tensor.shape[0], tensor.shape[1], dimension).to(tensor.device)
-    onehot.zero_().scatter_(2, tensor.unsqueeze(-1), 1)
-    return onehot
+    if tensor.dim() < 2:
+        tensor = tensor.view(1, -1)
+    return F.one_hot(tensor.long(), num_classes=dimension)